@@ -18,7 +18,6 @@ import logging
 import os
 import signal
 import sys
-import threading
 import time
 import _locale
 import schedule
@@ -133,7 +132,7 @@ if __name__ == "__main__":
 
         if sys.platform != "win32":
             signal.signal(signal.SIGINT, prev_sigint_handler)
-            threading.Thread(target=signal.raise_signal(signal.SIGINT)).start()
+            signal.raise_signal(signal.SIGINT)
 
     rc = 1
 
@@ -18,12 +18,12 @@
 """Common code for the auto PTS clients"""
 import argparse
 import datetime
-import errno
 import importlib
 import logging
 import os
 import queue
 import random
+import re
 import signal
 import socket
 import subprocess
@@ -34,6 +34,8 @@ import time
 import traceback
 import xml.etree.ElementTree as ElementTree
 import xmlrpc.client
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from distutils.spawn import find_executable
 from xmlrpc.server import SimpleXMLRPCServer
 
@@ -43,18 +45,39 @@ from termcolor import colored
 import ptsprojects.ptstypes as ptstypes
 from config import SERVER_PORT, CLIENT_PORT
 from ptsprojects import stack
-from ptsprojects.boards import com_to_tty, get_available_boards, tty_exists
+from ptsprojects.boards import clear_debugger_snr_cache, com_to_tty, \
+    get_available_boards, tty_exists
 from ptsprojects.testcase import PTSCallback, TestCaseLT1, TestCaseLT2
 from ptsprojects.testcase_db import TestCaseTable, DATABASE_FILE
 from pybtp import btp
 from pybtp.types import BTPError, SynchError
-from utils import InterruptableThread
+from utils import InterruptableThread, KeepAliveXMLRPCRequestHandler
 from winutils import have_admin_rights
 
 log = logging.debug
 
+
+def log_enabled():
+    """Returns True if messages passed to log() are not discarded"""
+    return logging.root.isEnabledFor(logging.DEBUG)
+
+
 RUNNING_TEST_CASE = {}
+# Guards RUNNING_TEST_CASE changes and test case state transitions, waited on
+# by synchronize_instances()
+RUNNING_TEST_CASE_COND = threading.Condition()
 TEST_CASE_DB = None
+# Number of test case results written to TEST_CASE_DB in one transaction
+TEST_CASE_DB_BATCH = 50
+# Last ykushcmd process started by board_power()
+YKUSH_PROCESS = None
+# Seconds to wait for the previous ykushcmd before it is killed
+YKUSH_TIMEOUT = 10
+# Serial ports and executables found by check_args(), with the time they
+# were found. Results older than FOUND_IN_CHECK_ARGS_TTL seconds are checked
+# again, e.g. the board may have been unplugged in the meantime.
+FOUND_IN_CHECK_ARGS = {}
+FOUND_IN_CHECK_ARGS_TTL = 60
 
 autoprojects = None
 
@@ -76,6 +99,8 @@ class PtsServerProxy(xmlrpc.client.ServerProxy):
     def __init__(self, uri, transport=None, encoding=None, verbose=False,
                  allow_none=False, use_datetime=False, use_builtin_types=False,
                  *, headers=(), context=None):
+        # Remote method callables are stateless, so create each one once
+        self._method_cache = {}
         super().__init__(uri, transport, encoding, verbose, allow_none, use_datetime,
                          use_builtin_types, headers=headers, context=context)
 
@@ -83,7 +108,18 @@ class PtsServerProxy(xmlrpc.client.ServerProxy):
         if RUN_END:
             raise RunEnd
 
-        return super().__getattr__(name)
+        method = self._method_cache.get(name)
+        if method is None:
+            method = super().__getattr__(name)
+            self._method_cache[name] = method
+
+        return method
+
+
+# Loggers of the ClientCallback methods, created once as getLogger() takes
+# the logging module lock on every call
+CALLBACK_LOG_LOGGER = logging.getLogger("ClientCallback.log")
+CALLBACK_IMPLICIT_SEND_LOGGER = logging.getLogger("ClientCallback.on_implicit_send")
 
 
 class ClientCallback(PTSCallback):
@@ -129,16 +165,17 @@ class ClientCallback(PTSCallback):
                          usage.
         """
 
-        logger = logging.getLogger("{}.{}".format(self.__class__.__name__,
-                                                  self.log.__name__))
-        logger.info("%s %s %s %s %s", ptstypes.PTS_LOGTYPE_STRING[log_type],
-                    logtype_string, log_time, test_case_name,
-                    log_message)
+        logger = CALLBACK_LOG_LOGGER
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s %s %s %s %s", ptstypes.PTS_LOGTYPE_STRING[log_type],
+                        logtype_string, log_time, test_case_name,
+                        log_message)
 
         try:
-            if test_case_name in RUNNING_TEST_CASE:
-                RUNNING_TEST_CASE[test_case_name].log(log_type, logtype_string,
-                                                      log_time, log_message, test_case_name)
+            test_case = RUNNING_TEST_CASE.get(test_case_name)
+            if test_case is not None:
+                test_case.log(log_type, logtype_string, log_time, log_message,
+                              test_case_name)
 
         except Exception as e:
             logging.exception(e)
@@ -164,16 +201,16 @@ class ClientCallback(PTSCallback):
         };
         """
 
-        logger = logging.getLogger("{}.{}".format(
-            self.__class__.__name__, self.on_implicit_send.__name__))
+        logger = CALLBACK_IMPLICIT_SEND_LOGGER
 
-        logger.info("*" * 20)
-        logger.info("BEGIN OnImplicitSend:")
-        logger.info("project_name: %s", project_name)
-        logger.info("wid: %s", wid)
-        logger.info("test_case_name: %s", test_case_name)
-        logger.info("description: %s", description)
-        logger.info("style: %s 0x%x", ptstypes.MMI_STYLE_STRING[style], style)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("*" * 20)
+            logger.info("BEGIN OnImplicitSend:")
+            logger.info("project_name: %s", project_name)
+            logger.info("wid: %s", wid)
+            logger.info("test_case_name: %s", test_case_name)
+            logger.info("description: %s", description)
+            logger.info("style: %s 0x%x", ptstypes.MMI_STYLE_STRING[style], style)
 
         try:
             # XXX: 361 WID MESH sends tc name with leading white spaces
@@ -200,10 +237,9 @@ class ClientCallback(PTSCallback):
         return testcase_response
 
     def get_pending_response(self, test_case_name):
-        log("%s.%s, %s", self.__class__.__name__,
-            self.get_pending_response.__name__, test_case_name)
-        if not self._pending_responses:
-            return None
+        if log_enabled():
+            log("%s.%s, %s", self.__class__.__name__,
+                self.get_pending_response.__name__, test_case_name)
 
         rsp = self._pending_responses.pop(test_case_name, None)
         if not rsp:
@@ -246,6 +282,7 @@ class CallbackThread(threading.Thread):
         self.port = port
         self.current_test_case = None
         self.end = False
+        self._lock = threading.Lock()
 
     def run(self):
         """Starts the xmlrpc callback server"""
@@ -253,19 +290,31 @@ class CallbackThread(threading.Thread):
 
         log("Serving on port %s ...", self.port)
 
-        self.server = SimpleXMLRPCServer(("", self.port),
-                                         allow_none=True, logRequests=False)
-        self.server.register_instance(self.callback)
-        self.server.register_introspection_functions()
-        self.server.timeout = 1.0
+        server = SimpleXMLRPCServer(("", self.port),
+                                    KeepAliveXMLRPCRequestHandler,
+                                    allow_none=True, logRequests=False)
+        server.register_instance(self.callback)
+        server.register_introspection_functions()
+
+        with self._lock:
+            self.server = server
+            end = self.end
 
-        while not self.end:
-            self.server.handle_request()
+        # serve_forever returns immediately if shutdown was already requested
+        if not end:
+            server.serve_forever(poll_interval=0.5)
 
-        self.server.server_close()
+        server.server_close()
 
     def stop(self):
-        self.end = True
+        with self._lock:
+            self.end = True
+            server = self.server
+
+        if server:
+            # shutdown() blocks until serve_forever() returns, so do not
+            # wait for it in the caller thread
+            threading.Thread(target=server.shutdown, daemon=True).start()
 
     def set_current_test_case(self, name):
         log("%s.%s %s", self.__class__.__name__, self.set_current_test_case.__name__, name)
@@ -280,8 +329,9 @@ class CallbackThread(threading.Thread):
         return self.callback.error_code()
 
     def set_pending_response(self, pending_response):
-        log("%s.%s, %r", self.__class__.__name__,
-            self.set_pending_response.__name__, pending_response)
+        if log_enabled():
+            log("%s.%s, %r", self.__class__.__name__,
+                self.set_pending_response.__name__, pending_response)
         return self.callback.set_pending_response(pending_response)
 
     def clear_pending_responses(self):
@@ -294,31 +344,50 @@ class CallbackThread(threading.Thread):
         return self.callback.cleanup()
 
 
+MY_IP_ADDRESS = None
+MY_IP_ADDRESS_LOCK = threading.Lock()
+
+
 def get_my_ip_address():
     """Returns the IP address of the host"""
-    if get_my_ip_address.cached_address:
-        return get_my_ip_address.cached_address
+    global MY_IP_ADDRESS
 
-    my_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    my_socket.connect(('8.8.8.8', 0))  # udp connection to google public dns
-    my_ip_address = my_socket.getsockname()[0]
+    my_ip_address = MY_IP_ADDRESS
+    if my_ip_address:
+        return my_ip_address
 
-    get_my_ip_address.cached_address = my_ip_address
-    return my_ip_address
+    # PTS init threads may ask concurrently, resolve the address only once
+    with MY_IP_ADDRESS_LOCK:
+        if MY_IP_ADDRESS:
+            return MY_IP_ADDRESS
+
+        # udp connection to google public dns
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as my_socket:
+            my_socket.connect(('8.8.8.8', 0))
+            MY_IP_ADDRESS = my_socket.getsockname()[0]
+
+        return MY_IP_ADDRESS
 
 
 def get_unique_name(pts):
+    # vars() is used, as attribute lookup of a missing name on the XML-RPC
+    # proxy would return a remote method instead of raising AttributeError
+    cached = vars(pts).get('q_unique_name')
+    if cached and cached[0] == pts.q_bd_addr:
+        return cached[1]
+
     name = 'Tester'
 
     # get address of PTS dongle IUT is connecting to
     pts_addr = pts.q_bd_addr.replace(":", "")
     # use last 6 characters of PTS dongle adress
     name += "_" + pts_addr[6:12]
+    name = name.encode('utf-8')
 
-    return name.encode('utf-8')
+    # cache per PTS dongle address, which changes only on reinitialization
+    pts.q_unique_name = (pts.q_bd_addr, name)
 
-
-get_my_ip_address.cached_address = None
+    return name
 
 
 def init_logging(tag=""):
@@ -342,11 +411,28 @@ class FakeProxy:
     Usefull when testing code locally and auto-pts server is not needed"""
 
     class System:
+        def __init__(self, proxy):
+            self._proxy = proxy
+
         def listMethods(self):
             pass
 
+        def multicall(self, calls):
+            """Emulates system.multicall, so xmlrpc.client.MultiCall can be
+            used with FakeProxy"""
+            results = []
+
+            for call in calls:
+                method = self._proxy
+                for name in call['methodName'].split('.'):
+                    method = getattr(method, name)
+
+                results.append([method(*call['params'])])
+
+            return results
+
     def __init__(self):
-        self.system = FakeProxy.System()
+        self.system = FakeProxy.System(self)
 
     def restart_pts(self):
         pass
@@ -372,6 +458,9 @@ class FakeProxy:
     def enable_maximum_logging(self, enable):
         pass
 
+    def set_pixit(self, project_name, param_name, param_value):
+        pass
+
     def update_pixit_param(self, project_name, param_name, new_param_value):
         pass
 
@@ -379,6 +468,40 @@ class FakeProxy:
         pass
 
 
+def call_batched(proxy, calls):
+    """Makes calls, a list of (method name, *params) tuples, in a single
+    system.multicall and returns their results
+
+    Servers not supporting system.multicall (older autoptsserver versions)
+    are called one by one instead. Raises xmlrpc.client.Fault of the first
+    failed call.
+
+    """
+    multicall = xmlrpc.client.MultiCall(proxy)
+    for name, *params in calls:
+        method = multicall
+        for attr in name.split('.'):
+            method = getattr(method, attr)
+        method(*params)
+
+    try:
+        results = multicall()
+    except xmlrpc.client.Fault as fault:
+        if 'system.multicall' not in fault.faultString:
+            raise
+
+        log("system.multicall not supported, calling one by one")
+        results = []
+        for name, *params in calls:
+            method = proxy
+            for attr in name.split('.'):
+                method = getattr(method, attr)
+            results.append(method(*params))
+
+    # iterating MultiCall results raises the Fault of a failed call
+    return tuple(results)
+
+
 def init_pts_thread_entry_wrapper(func):
     def wrapper(*args):
         exeptions = args[6]
@@ -402,33 +525,43 @@ def init_pts_thread_entry(proxy, local_address, local_port, workspace_path,
 
     proxy.callback_thread.start()
 
-    proxy.set_call_timeout(300000)  # milliseconds
-
-    log("Server methods: %s", proxy.system.listMethods())
-    log("PTS Version: %s", proxy.get_version())
-
-    # cache locally for quick access (avoid contacting server)
-    proxy.q_bd_addr = proxy.bd_addr()
-    log("PTS BD_ADDR: %s", proxy.q_bd_addr)
-
     client_ip_address = local_address
     if client_ip_address is None:
         client_ip_address = get_my_ip_address()
 
     log("Client IP Address: %s", client_ip_address)
+    log("Opening workspace: %s", workspace_path)
 
-    proxy.register_xmlrpc_ptscallback(client_ip_address, local_port)
+    # Independent calls are batched to save round trips to the server
+    calls = [('set_call_timeout', 300000),  # milliseconds
+             ('system.listMethods',),
+             ('get_version',),
+             ('bd_addr',),
+             ('register_xmlrpc_ptscallback', client_ip_address, local_port),
+             ('open_workspace', workspace_path)]
+    if bd_addr:
+        calls.append(('get_project_list',))
 
-    log("Opening workspace: %s", workspace_path)
-    proxy.open_workspace(workspace_path)
+    _, methods, version, pts_bd_addr, _, _, *projects = call_batched(proxy, calls)
+
+    log("Server methods: %s", methods)
+    log("PTS Version: %s", version)
+
+    # cache locally for quick access (avoid contacting server)
+    proxy.q_bd_addr = pts_bd_addr
+    proxy.q_version = version
+    log("PTS BD_ADDR: %s", proxy.q_bd_addr)
+
+    calls = []
 
     if bd_addr:
-        projects = proxy.get_project_list()
-        for project_name in projects:
+        for project_name in projects[0]:
             log("Set bd_addr PIXIT: %s for project: %s", bd_addr, project_name)
-            proxy.update_pixit_param(project_name, "TSPX_bd_addr_iut", bd_addr)
+            calls.append(('update_pixit_param', project_name, "TSPX_bd_addr_iut", bd_addr))
+
+    calls.append(('enable_maximum_logging', enable_max_logs))
 
-    proxy.enable_maximum_logging(enable_max_logs)
+    call_batched(proxy, calls)
 
 
 def init_pts(args, ptses, tc_db_table_name=None):
@@ -473,19 +606,21 @@ def init_pts(args, ptses, tc_db_table_name=None):
         global TEST_CASE_DB
         TEST_CASE_DB = TestCaseTable(tc_db_table_name, args.database_file)
 
+    # Init threads run in parallel, so they share one 180 seconds deadline
+    # instead of each join waiting up to 180 seconds
+    deadline = time.monotonic() + 180.0
+
     for index, thread in enumerate(thread_list):
-        thread.join(timeout=180.0)
+        thread.join(timeout=max(0.0, deadline - time.monotonic()))
 
         # check init completed
         if thread.is_alive():
             raise Exception("(%r) init failed" % (id(proxy_list[index]),))
 
-    exeption_msg = ''
-    while not exceptions.empty():
-        try:
-            exeption_msg += str(exceptions.get_nowait()) + '\n'
-        except queue.Empty:
-            break
+    # All init threads have finished, so the queue can be drained at once
+    with exceptions.mutex:
+        exeption_msg = ''.join(str(exc) + '\n' for exc in exceptions.queue)
+        exceptions.queue.clear()
 
     if exeption_msg:
         raise Exception(exeption_msg)
@@ -494,14 +629,30 @@ def init_pts(args, ptses, tc_db_table_name=None):
 
 
 def shutdown_pts(ptses):
-    for pts in ptses:
-        proxy = xmlrpc.client.ServerProxy(
-            'http://%s/' % pts.__getattribute__('_ServerProxy__host'),
-            allow_none=True)
-        proxy.unregister_xmlrpc_ptscallback()
+    def shutdown_pts_one(pts):
+        try:
+            if isinstance(pts, xmlrpc.client.ServerProxy):
+                # Test case threads may still be blocked in a call on the
+                # connection of pts, and set_end() makes PtsServerProxy
+                # raise RunEnd, so unregister over a separate proxy
+                proxy = xmlrpc.client.ServerProxy(
+                    'http://%s/' % pts.__getattribute__('_ServerProxy__host'),
+                    allow_none=True)
+                proxy.unregister_xmlrpc_ptscallback()
+            else:
+                pts.unregister_xmlrpc_ptscallback()
+        except Exception as e:
+            logging.exception(e)
+        finally:
+            if isinstance(pts.callback_thread, CallbackThread):
+                pts.callback_thread.stop()
+
+    if not ptses:
+        return
 
-        if isinstance(pts.callback_thread, CallbackThread):
-            pts.callback_thread.stop()
+    # PTS instances are independent, so unregister them concurrently
+    with ThreadPoolExecutor(max_workers=len(ptses)) as executor:
+        list(executor.map(shutdown_pts_one, ptses))
 
 
 def get_result_color(status):
@@ -520,16 +671,34 @@ class TestCaseRunStats:
         self.run_count_max = retry_count + 1  # Run test at least once
         self.run_count = 0  # Run count of current test case
         self.num_test_cases = len(test_cases)
+        self.num_skipped = 0  # Test cases recorded by update_skipped()
         self.num_test_cases_width = len(str(self.num_test_cases))
         self.max_project_name = len(max(projects, key=len)) if projects else 0
         self.max_test_case_name = len(max(test_cases, key=len)) if test_cases else 0
         self.margin = 3
         self.index = 0
-
+        # stdout does not change during the run, avoid isatty() per print
+        self.stdout_isatty = sys.stdout.isatty()
+
+        # Column layout of the per test case output, constant for the run
+        self.num_test_cases_col = "/" + str(self.num_test_cases).ljust(
+            self.num_test_cases_width + self.margin)
+        self.project_name_width = self.max_project_name + self.margin
+        self.test_case_name_width = self.max_test_case_name + self.margin - 1
+        self.retries_width = len("#{}".format(retry_count)) + self.margin
+        self.regression_width = len("REGRESSION") + self.margin
+
+        # Results are kept in memory, xml_results file is only appended with
+        # test case elements that will not change anymore.
         self.xml_results = tempfile.NamedTemporaryFile(delete=False).name
-        root = ElementTree.Element("results")
-        tree = ElementTree.ElementTree(root)
-        tree.write(self.xml_results)
+        self._root = ElementTree.Element("results")
+        self._xml_file = open(self.xml_results, 'wb')
+        self._xml_file.write(b"<results>")
+        self._xml_pending = None
+        self._by_name = {}
+        self._status_count = Counter()
+        # dict used as an insertion ordered set of regression names
+        self._regressions = {}
 
         self.db = db
 
@@ -544,12 +713,14 @@ class TestCaseRunStats:
             self.est_duration = 0
 
     def update(self, test_case_name, duration, status):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
-
-        elem = root.find("./test_case[@name='%s']" % test_case_name)
+        elem = self._by_name.get(test_case_name)
         if elem is None:
-            elem = ElementTree.SubElement(root, 'test_case')
+            # Test cases are run one by one, so the previous one is final
+            self._write_pending()
+
+            elem = ElementTree.SubElement(self._root, 'test_case')
+            self._xml_pending = elem
+            self._by_name[test_case_name] = elem
 
             status_previous = None
             if self.db:
@@ -565,52 +736,83 @@ class TestCaseRunStats:
         else:
             run_count = int(elem.attrib["run_count"])
 
+            status_old = elem.attrib["status"]
+            self._status_count[status_old] -= 1
+            if not self._status_count[status_old]:
+                del self._status_count[status_old]
+
         elem.attrib["status"] = status
+        self._status_count[status] += 1
 
         regression = bool(elem.attrib["status"] != "PASS" and elem.attrib["status_previous"] == "PASS")
 
+        if regression:
+            self._regressions[test_case_name] = None
+        else:
+            self._regressions.pop(test_case_name, None)
+
         elem.attrib["regression"] = str(regression)
         elem.attrib["run_count"] = str(run_count + 1)
 
-        tree.write(self.xml_results)
-
         return regression
 
-    def get_results(self):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
+    def update_skipped(self, test_case_name, status):
+        """Records a test case that is not run, with the given status"""
+        self._write_pending()
+
+        elem = ElementTree.SubElement(self._root, 'test_case')
+        self._by_name[test_case_name] = elem
+
+        elem.attrib["project"] = test_case_name.split('/')[0]
+        elem.attrib["name"] = test_case_name
+        elem.attrib["duration"] = "0"
+        elem.attrib["status"] = status
+        elem.attrib["status_previous"] = "PASS"
+        elem.attrib["regression"] = "False"
+        elem.attrib["run_count"] = "0"
 
+        self._status_count[status] += 1
+        self.num_skipped += 1
+
+        # Final already, no need to keep it pending
+        self._xml_file.write(ElementTree.tostring(elem))
+
+    def _write_pending(self):
+        if self._xml_pending is None:
+            return
+
+        self._xml_file.write(ElementTree.tostring(self._xml_pending))
+        self._xml_file.flush()
+        self._xml_pending = None
+
+    def close(self):
+        """Completes and closes xml_results file"""
+        if self._xml_file.closed:
+            return
+
+        self._write_pending()
+        self._xml_file.write(b"</results>")
+        self._xml_file.close()
+
+    def get_results(self):
         results = {}
 
-        for tc_xml in root.findall("./test_case"):
+        for tc_xml in self._root:
             results[tc_xml.attrib["name"]] = \
                 (tc_xml.attrib["status"], tc_xml.attrib["run_count"])
 
         return results
 
     def get_regressions(self):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
-        tcs_xml = root.findall("./test_case[@regression='True']")
-
-        return [tc_xml.attrib["name"] for tc_xml in tcs_xml]
+        return list(self._regressions)
 
     def get_status_count(self):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
-
-        status_dict = {}
-
-        for test_case_xml in root.findall("./test_case"):
-            if test_case_xml.attrib["status"] not in status_dict:
-                status_dict[test_case_xml.attrib["status"]] = 0
-
-            status_dict[test_case_xml.attrib["status"]] += 1
-
-        return status_dict
+        return dict(self._status_count)
 
     def print_summary(self):
         """Prints test case list status summary"""
+        self.close()
+
         print("\nSummary:\n")
 
         status_str = "Status"
@@ -621,7 +823,7 @@ class TestCaseRunStats:
         regressions_str_len = len(regressions_str)
         regressions_count = len(self.get_regressions())
         regressions_count_str_len = len(str(regressions_count))
-        num_test_cases_str = str(self.num_test_cases)
+        num_test_cases_str = str(self.num_test_cases + self.num_skipped)
         num_test_cases_str_len = len(num_test_cases_str)
         status_count = self.get_status_count()
 
@@ -667,20 +869,12 @@ def run_test_case_wrapper(func):
         test_case_name = args[2]
         stats = args[3]
 
-        run_count_max = stats.run_count_max
         run_count = stats.run_count
-        num_test_cases = stats.num_test_cases
-        num_test_cases_width = stats.num_test_cases_width
-        max_project_name = stats.max_project_name
-        max_test_case_name = stats.max_test_case_name
-        margin = stats.margin
-        index = stats.index
-
-        print((str(index + 1).rjust(num_test_cases_width) +
-               "/" +
-               str(num_test_cases).ljust(num_test_cases_width + margin) +
-               test_case_name.split('/')[0].ljust(max_project_name + margin) +
-               test_case_name.ljust(max_test_case_name + margin - 1)), end=' ')
+
+        print((str(stats.index + 1).rjust(stats.num_test_cases_width) +
+               stats.num_test_cases_col +
+               test_case_name.split('/')[0].ljust(stats.project_name_width) +
+               test_case_name.ljust(stats.test_case_name_width)), end=' ')
         sys.stdout.flush()
 
         start_time = time.time()
@@ -689,7 +883,7 @@ def run_test_case_wrapper(func):
 
         regression = stats.update(test_case_name, end_time, status)
 
-        retries_max = run_count_max - 1
+        retries_max = stats.run_count_max - 1
         if run_count:
             retries_msg = "#{}".format(run_count)
         else:
@@ -704,11 +898,11 @@ def run_test_case_wrapper(func):
             seconds=end_time).total_seconds(), 3))
 
         result = ("{}".format(status).ljust(16) +
-                  end_time_str.rjust(len(end_time_str)) +
-                  retries_msg.rjust(len("#{}".format(retries_max)) + margin) +
-                  regression_msg.rjust(len("REGRESSION") + margin))
+                  end_time_str +
+                  retries_msg.rjust(stats.retries_width) +
+                  regression_msg.rjust(stats.regression_width))
 
-        if sys.stdout.isatty():
+        if stats.stdout_isatty:
             output_color = get_result_color(status)
             print(colored(result, output_color))
         else:
@@ -741,10 +935,27 @@ def get_error_code(exc):
     return error_code
 
 
+def set_test_case_state(test_case, state):
+    """Sets test case state and wakes up instances waiting for it"""
+    with RUNNING_TEST_CASE_COND:
+        test_case.state = state
+        RUNNING_TEST_CASE_COND.notify_all()
+
+
+# Test case states in the order they are entered by run_test_case_thread_entry
+TEST_CASE_STATES = (None, "PRE_RUN", "RUNNING", "FINISHING")
+
+
 def synchronize_instances(state, break_state=None):
-    """Synchronize instances to be in one state before executing further"""
-    while True:
-        time.sleep(1)
+    """Synchronize instances to be in one state before executing further
+
+    Instances that already went past the state are not waited for, as they
+    might have left it before this waiter was woken up.
+
+    """
+    state_index = TEST_CASE_STATES.index(state)
+
+    def all_in_state():
         match = True
 
         for tc in RUNNING_TEST_CASE.values():
@@ -752,11 +963,13 @@ def synchronize_instances(state, break_state=None):
                 if break_state and tc.state in break_state:
                     raise SynchError
 
-                match = False
-                continue
+                if TEST_CASE_STATES.index(tc.state) < state_index:
+                    match = False
 
-        if match:
-            return
+        return match
+
+    with RUNNING_TEST_CASE_COND:
+        RUNNING_TEST_CASE_COND.wait_for(all_in_state)
 
 
 def run_test_case_thread_entry_wrapper(func):
@@ -766,7 +979,7 @@ def run_test_case_thread_entry_wrapper(func):
             func(*args)
         except Exception as exc:
             logging.exception(exc)
-            exeptions.put(exc)
+            exeptions.append(exc)
 
     return wrapper
 
@@ -791,11 +1004,10 @@ def run_test_case_thread_entry(pts, test_case, exceptions):
     error_code = None
 
     try:
-        RUNNING_TEST_CASE[test_case.name] = test_case
-        test_case.state = "PRE_RUN"
+        set_test_case_state(test_case, "PRE_RUN")
         test_case.pre_run()
         test_case.status = "RUNNING"
-        test_case.state = "RUNNING"
+        set_test_case_state(test_case, "RUNNING")
         pts.callback_thread.set_current_test_case(test_case.name)
         synchronize_instances(test_case.state)
         error_code = pts.run_test_case(test_case.project_name, test_case.name)
@@ -824,37 +1036,52 @@ def run_test_case_thread_entry(pts, test_case, exceptions):
                 pts.recover_pts()
         except Exception as error:
             logging.exception(error)
-            exceptions.put(error)
-        test_case.state = "FINISHING"
+            exceptions.append(error)
+        set_test_case_state(test_case, "FINISHING")
         synchronize_instances(test_case.state)
         test_case.post_run(error_code)  # stop qemu and other commands
-        del RUNNING_TEST_CASE[test_case.name]
+
+        with RUNNING_TEST_CASE_COND:
+            del RUNNING_TEST_CASE[test_case.name]
+            RUNNING_TEST_CASE_COND.notify_all()
 
     log("Done TestCase %s %s", run_test_case_thread_entry.__name__,
         test_case)
 
 
-def run_test_case_thread_fun(results, ptses, test_case_instances, test_case_name, stats,
+def run_test_case_thread_fun(results, ptses, test_case_index, test_case_name, stats,
                              session_log_dir, exceptions):
-    status, duration = run_test_case(ptses, test_case_instances, test_case_name, stats,
+    status, duration = run_test_case(ptses, test_case_index, test_case_name, stats,
                                      session_log_dir, exceptions)
     results.append(status)
     results.append(duration)
 
 
+def index_test_case_instances(test_case_instances):
+    """Return dict of test case instances keyed by (name, LT class)
+
+    The first instance wins if there are more with the same key.
+
+    """
+    test_case_index = {}
+
+    if test_case_instances is None:
+        return test_case_index
+
+    for tc in test_case_instances:
+        for test_case_class in (TestCaseLT1, TestCaseLT2):
+            if isinstance(tc, test_case_class):
+                test_case_index.setdefault((tc.name, test_case_class), tc)
+
+    return test_case_index
+
+
 @run_test_case_wrapper
-def run_test_case(ptses, test_case_instances, test_case_name, stats,
+def run_test_case(ptses, test_case_index, test_case_name, stats,
                   session_log_dir, exceptions):
     def test_case_lookup_name(name, test_case_class):
         """Return 'test_case_class' instance if found or None otherwise"""
-        if test_case_instances is None:
-            return None
-
-        for tc in test_case_instances:
-            if tc.name == name and isinstance(tc, test_case_class):
-                return tc
-
-        return None
+        return test_case_index.get((name, test_case_class))
 
     logger = logging.getLogger()
 
@@ -883,41 +1110,77 @@ def run_test_case(ptses, test_case_instances, test_case_name, stats,
         if test_case_lt2 is None:
             # FIXME
             return 'NOT_IMPLEMENTED'
+
+        # The instance may be reused from a previous run, e.g. on retry, and
+        # a stale state would let synchronize_instances() skip waiting for it
+        test_case_lt2.reset()
     else:
         test_case_lt2 = None
 
-    while True:
-        # Multiple PTS instances test cases may fill status already
-        if test_case_lt1.status != 'init':
-            continue
+    # Multi-instance related stuff
+    pts_threads = []
 
-        # Multi-instance related stuff
-        pts_threads = []
+    # Register all instances before any of them starts, so that
+    # synchronize_instances() waits for every one of them
+    if not AUTO_PTS_LOCAL:
+        with RUNNING_TEST_CASE_COND:
+            RUNNING_TEST_CASE[test_case_lt1.name] = test_case_lt1
+            if test_case_lt2:
+                RUNNING_TEST_CASE[test_case_lt2.name] = test_case_lt2
 
+    pts_thread = threading.Thread(
+        target=run_test_case_thread_entry,
+        args=(ptses[0], test_case_lt1, exceptions))
+    pts_threads.append(pts_thread)
+    pts_thread.start()
+
+    if test_case_lt2:
         pts_thread = threading.Thread(
             target=run_test_case_thread_entry,
-            args=(ptses[0], test_case_lt1, exceptions))
+            args=(ptses[1], test_case_lt2, exceptions))
         pts_threads.append(pts_thread)
         pts_thread.start()
 
-        if test_case_lt2:
-            pts_thread = threading.Thread(
-                target=run_test_case_thread_entry,
-                args=(ptses[1], test_case_lt2, exceptions))
-            pts_threads.append(pts_thread)
-            pts_thread.start()
+    # Wait till every PTS instance finish executing test case
+    for pts_thread in pts_threads:
+        pts_thread.join()
+
+    logger.removeHandler(file_handler)
+
+    if test_case_lt2 and test_case_lt2.status != "PASS" \
+            and test_case_lt1.status == "PASS":
+        return test_case_lt2.status
+
+    return test_case_lt1.status
+
 
-        # Wait till every PTS instance finish executing test case
-        for pts_thread in pts_threads:
-            pts_thread.join()
+PROJECT_LISTING_CACHE = {}
 
-        logger.removeHandler(file_handler)
 
-        if test_case_lt2 and test_case_lt2.status != "PASS" \
-                and test_case_lt1.status == "PASS":
-            return test_case_lt2.status
+def clear_project_listing_cache():
+    """Forgets cached listings, e.g. when the workspace may have changed"""
+    PROJECT_LISTING_CACHE.clear()
 
-        return test_case_lt1.status
+
+def get_project_listing(pts, workspace):
+    """Returns dict of workspace project names and their test case lists
+
+    The listing is cached per PTS server, PTS version and workspace, since
+    it does not change when the same workspace is reopened, e.g. on the next
+    run or after recovery.
+
+    """
+    # A PTS upgrade changes the test case lists of the same workspace
+    key = (vars(pts).get('_ServerProxy__host'), vars(pts).get('q_version'),
+           workspace)
+
+    project_listing = PROJECT_LISTING_CACHE.get(key)
+    if project_listing is None:
+        project_listing = {project: pts.get_test_case_list(project)
+                           for project in pts.get_project_list()}
+        PROJECT_LISTING_CACHE[key] = project_listing
+
+    return project_listing
 
 
 test_case_blacklist = [
@@ -927,108 +1190,151 @@ test_case_blacklist = [
 ]
 
 
+def skip_passed_test_cases(test_cases, days):
+    """Splits test cases into the ones to run and the ones that passed
+    within last days"""
+    since = time.time() - days * 24 * 60 * 60
+    last_results = TEST_CASE_DB.get_last_results()
+    not_passed = []
+    passed = []
+
+    for test_case in test_cases:
+        last = last_results.get(test_case)
+        if last and last[0] == 'PASS' and last[1] and last[1] >= since:
+            passed.append(test_case)
+        else:
+            not_passed.append(test_case)
+
+    if passed:
+        print("Skipping %d test cases passed within last %s days" % (len(passed), days))
+
+    return not_passed, passed
+
+
 def run_test_cases(ptses, test_case_instances, args):
     """Runs a list of test cases"""
 
-    def run_or_not(test_case_name):
-        for entry in test_case_blacklist:
-            if entry in test_case_name:
-                return False
+    # str.startswith() accepts a tuple of prefixes and checks them all at once
+    excluded = tuple(args.excluded or ())
+    included = tuple(args.test_cases or ())
 
-        if args.excluded:
-            for n in args.excluded:
-                if test_case_name.startswith(n):
-                    return False
+    # Blacklist entries may be anywhere in the name, so search for all of
+    # them with one alternation. "(?!)" never matches, for empty blacklist.
+    blacklist_re = re.compile("|".join(re.escape(entry)
+                                       for entry in test_case_blacklist) or "(?!)")
 
-        if args.test_cases:
-            for n in args.test_cases:
-                if test_case_name.startswith(n):
-                    return True
+    def run_or_not(test_case_name):
+        if blacklist_re.search(test_case_name):
+            return False
 
+        if test_case_name.startswith(excluded):
             return False
 
+        if included:
+            return test_case_name.startswith(included)
+
         return True
 
     ports_str = '_'.join(str(x) for x in args.cli_port)
     now = datetime.datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
     session_log_dir = 'logs/cli_port_' + ports_str + '/' + now
-    try:
-        os.makedirs(session_log_dir)
-    except OSError as e:
-        if e.errno != errno.EEXIST:
-            raise
+    os.makedirs(session_log_dir, exist_ok=True)
 
-    test_cases = []
+    project_listing = get_project_listing(ptses[0], args.workspace)
+    projects = list(project_listing)
 
-    projects = ptses[0].get_project_list()
+    test_cases = []
 
-    for project in projects:
-        _test_case_list = ptses[0].get_test_case_list(project)
+    for _test_case_list in project_listing.values():
         test_cases += [tc for tc in _test_case_list if run_or_not(tc)]
 
+    skipped_test_cases = []
+    if args.skip_passed_since and TEST_CASE_DB and not args.stress_test:
+        test_cases, skipped_test_cases = \
+            skip_passed_test_cases(test_cases, args.skip_passed_since)
+
+    test_case_index = index_test_case_instances(test_case_instances)
+
     # Statistics
     stats = TestCaseRunStats(projects, test_cases, args.retry, TEST_CASE_DB)
+    for test_case in skipped_test_cases:
+        stats.update_skipped(test_case, "SKIPPED_PASSED")
 
-    exceptions = queue.Queue()
+    # Test case threads only append and the main thread pops, both of which
+    # are thread safe deque operations
+    exceptions = deque()
 
-    for test_case in test_cases:
-        stats.run_count = 0
-
-        while True:
-            timeout = False
-
-            if args.superguard:
-                results = []
-                guarded_thread = InterruptableThread(target=run_test_case_thread_fun,
-                                                     args=(results, ptses,
-                                                           test_case_instances,
-                                                           test_case, stats,
-                                                           session_log_dir,
-                                                           exceptions), daemon=True)
-
-                guarded_thread.start()
-                guarded_thread.join(timeout=args.superguard)
-
-                if guarded_thread.is_alive():
-                    exceptions.put(Exception('Superguard timeout'))
-                    guarded_thread.interrupt()
-                    status = 'SUPERGUARD TIMEOUT'
-                    duration = args.superguard
-                    timeout = True
+    # Results are committed to the database in batches
+    pending_statistics = []
+
+    def flush_statistics():
+        if pending_statistics:
+            TEST_CASE_DB.update_statistics_batch(pending_statistics)
+            pending_statistics.clear()
+
+    try:
+        for test_case in test_cases:
+            stats.run_count = 0
+
+            while True:
+                timeout = False
+
+                if args.superguard:
+                    results = []
+                    guarded_thread = InterruptableThread(target=run_test_case_thread_fun,
+                                                         args=(results, ptses,
+                                                               test_case_index,
+                                                               test_case, stats,
+                                                               session_log_dir,
+                                                               exceptions), daemon=True)
+
+                    guarded_thread.start()
+                    guarded_thread.join(timeout=args.superguard)
+
+                    if guarded_thread.is_alive():
+                        exceptions.append(Exception('Superguard timeout'))
+                        guarded_thread.interrupt()
+                        status = 'SUPERGUARD TIMEOUT'
+                        duration = args.superguard
+                        timeout = True
+                    else:
+                        status = results[0]
+                        duration = results[1]
                 else:
-                    status = results[0]
-                    duration = results[1]
-            else:
-                status, duration = run_test_case(ptses, test_case_instances,
-                                                 test_case, stats,
-                                                 session_log_dir, exceptions)
+                    status, duration = run_test_case(ptses, test_case_index,
+                                                     test_case, stats,
+                                                     session_log_dir, exceptions)
 
-            if RUN_END:
-                raise RunEnd
+                if RUN_END:
+                    raise RunEnd
 
-            exeption_msg = ''
-            while not exceptions.empty():
-                try:
-                    exeption_msg += str(exceptions.get_nowait()) + '\n'
-                except BaseException as e:
-                    logging.exception(e)
-                    traceback.print_exc()
-                finally:
+                exeption_msgs = []
+                while exceptions:
+                    exeption_msgs.append(str(exceptions.popleft()))
+
+                exeption_msg = '\n'.join(exeption_msgs)
+                if exeption_msg:
                     print(exeption_msg)
 
-            if timeout or args.recovery and \
-                    (exeption_msg != '' or status not in {'PASS', 'INCONC', 'FAIL', "NOT_IMPLEMENTED"}):
-                run_recovery(args, ptses)
+                if timeout or args.recovery and \
+                        (exeption_msg != '' or status not in {'PASS', 'INCONC', 'FAIL', "NOT_IMPLEMENTED"}):
+                    run_recovery(args, ptses)
 
-            if (status == 'PASS' and not args.stress_test) or stats.run_count == args.retry:
-                if TEST_CASE_DB:
-                    TEST_CASE_DB.update_statistics(test_case, duration, status)
+                if (status == 'PASS' and not args.stress_test) or stats.run_count == args.retry:
+                    if TEST_CASE_DB:
+                        pending_statistics.append((test_case, duration, status))
+                        if len(pending_statistics) >= TEST_CASE_DB_BATCH:
+                            flush_statistics()
 
-                break
+                    break
 
-            stats.run_count += 1
+                stats.run_count += 1
 
-        stats.index += 1
+            stats.index += 1
+    finally:
+        flush_statistics()
+        # Leave a complete results file also when the run is aborted
+        stats.close()
 
     stats.print_summary()
 
@@ -1069,6 +1375,11 @@ class CliParser(argparse.ArgumentParser):
         self.add_argument("--stress_test", action='store_true', default=False,
                           help="Repeat every test even if previous result was PASS")
 
+        self.add_argument("--skip-passed-since", type=float, default=0, metavar='DAYS',
+                          help="Do not run test cases that passed within given "
+                               "number of days. Requires test case results to be "
+                               "stored in the database. Ignored with --stress_test")
+
         self.add_argument("-S", "--srv_port", type=int, nargs="+", default=[SERVER_PORT],
                           help="Specify the server port number")
 
@@ -1151,10 +1462,22 @@ class Client:
         self.boards = None if hw_mode else get_available_boards(project)
         self.ptses = []
         self.args = None
-        self.arg_parser = CliParser("PTS automation client", self.boards)
-        self.add_positional_args()
+        # Built on first use, subclasses usually replace it with their own
+        self._arg_parser = None
         self.prev_sigint_handler = None
 
+    @property
+    def arg_parser(self):
+        if self._arg_parser is None:
+            self._arg_parser = CliParser("PTS automation client", self.boards)
+            self.add_positional_args()
+
+        return self._arg_parser
+
+    @arg_parser.setter
+    def arg_parser(self, arg_parser):
+        self._arg_parser = arg_parser
+
     def start(self, args=None):
         """Start main with exception handling."""
 
@@ -1164,7 +1487,7 @@ class Client:
 
             if sys.platform != "win32":
                 signal.signal(signal.SIGINT, self.prev_sigint_handler)
-                threading.Thread(target=signal.raise_signal(signal.SIGINT)).start()
+                signal.raise_signal(signal.SIGINT)
 
         try:
             self.prev_sigint_handler = signal.getsignal(signal.SIGINT)
@@ -1191,10 +1514,11 @@ class Client:
         self.args = self.parse_args(_args)
 
         # root privileges only needed for native mode.
+        admin_rights = have_admin_rights()
         if self.args.hci is not None:
-            if not have_admin_rights():
+            if not admin_rights:
                 sys.exit("Please run this program as root.")
-        elif have_admin_rights():
+        elif admin_rights:
             sys.exit("Please do not run this program as root.")
 
         if self.args.store:
@@ -1264,7 +1588,7 @@ class Client:
             time.sleep(1)
 
         if 'tty_file' in args and args.tty_file:
-            if not tty_exists(args.tty_file):
+            if not cached_check('tty', args.tty_file, tty_exists):
                 sys.exit("%s serial port does not exist!" % repr(args.tty_file))
 
             if args.tty_file.startswith("COM"):
@@ -1276,7 +1600,7 @@ class Client:
             if not os.path.exists(args.btpclient_path):
                 sys.exit("Path %s of btpclient.py file does not exist!" % repr(args.btpclient_path))
         elif qemu_bin:
-            if not find_executable(qemu_bin):
+            if not cached_check('executable', qemu_bin, find_executable):
                 sys.exit("In QEMU mode %s is needed but not found!" % (qemu_bin,))
 
             if args.kernel_image is None or not os.path.isfile(args.kernel_image):
@@ -1309,13 +1633,26 @@ def set_end():
 
 
 def run_recovery(args, ptses):
+    # args.superguard is already converted to seconds by check_args()
+    restart_timeout = args.superguard or 60
+
     def wait_for_server_restart(pts):
-        for i in range(int(args.superguard) if args.superguard else 60):
+        deadline = time.monotonic() + restart_timeout
+        i = 0
+        while time.monotonic() < deadline:
             try:
                 if pts.ready():
                     break
             except Exception:
-                time.sleep(1)
+                pass
+
+            # Do not hold a keep-alive connection while the server restarts
+            if isinstance(pts, xmlrpc.client.ServerProxy):
+                pts('close')()
+
+            # Back off from 20 ms up to 500 ms between polls
+            time.sleep(min(0.5, 0.02 * (1.5 ** i)))
+            i += 1
 
     log('Running recovery')
 
@@ -1323,18 +1660,17 @@ def run_recovery(args, ptses):
     if ykush:
         board_power(ykush, False)
 
-    for pts in ptses:
-        wait_for_server_restart(pts)
+    # Waits are I/O bound and the servers independent, so overlap them
+    with ThreadPoolExecutor(max_workers=len(ptses) or 1) as executor:
+        list(executor.map(wait_for_server_restart, ptses))
 
-    try:
-        for pts in ptses:
-            pts.request_recovery()
-    except Exception as e:
-        logging.exception(e)
-        traceback.print_exc()
+        try:
+            list(executor.map(lambda pts: pts.request_recovery(), ptses))
+        except Exception as e:
+            logging.exception(e)
+            traceback.print_exc()
 
-    for pts in ptses:
-        wait_for_server_restart(pts)
+        list(executor.map(wait_for_server_restart, ptses))
 
     if ykush:
         board_power(ykush, True)
@@ -1343,6 +1679,8 @@ def run_recovery(args, ptses):
 
     stack_inst = stack.get_stack()
     stack_inst.cleanup()
+    # init_pts() created new callback threads, so the synch always has to be
+    # rebound to them
     stack_inst.synch_init([pts.callback_thread for pts in ptses])
 
     setup_project_pixits(ptses)
@@ -1354,11 +1692,42 @@ def setup_project_name(project):
     autoprojects = importlib.import_module('ptsprojects.' + project)
 
 
+class PixitMultiCall:
+    """Queues set_pixit() calls of a PTS to send them in one system.multicall
+
+    Nothing else is exposed, as results of queued calls are not known until
+    the multicall is sent, so any other use by set_pixits() fails loudly.
+
+    """
+
+    def __init__(self, pts):
+        self._pts = pts
+        self._calls = []
+
+    def set_pixit(self, project_name, param_name, param_value):
+        self._calls.append(('set_pixit', project_name, param_name, param_value))
+
+    def send(self):
+        call_batched(self._pts, self._calls)
+
+
 def setup_project_pixits(ptses):
+    # set_pixits() only calls set_pixit(), so queue the calls of all profiles
+    # and send them in one system.multicall per PTS
+    multicalls = [PixitMultiCall(pts) for pts in ptses]
+
     for profile in profiles:
         mod = getattr(autoprojects, profile, None)
         if mod is not None:
-            mod.set_pixits(ptses)
+            mod.set_pixits(multicalls)
+
+    if not multicalls:
+        return
+
+    # A proxy is not thread safe, but different PTS instances can be used
+    # concurrently
+    with ThreadPoolExecutor(max_workers=len(multicalls)) as executor:
+        list(executor.map(PixitMultiCall.send, multicalls))
 
 
 def setup_test_cases(ptses):
@@ -1372,12 +1741,46 @@ def setup_test_cases(ptses):
     return test_cases
 
 
+def cached_check(kind, name, check):
+    """Returns check(name), a positive result is remembered for a while
+
+    Listing serial ports and searching PATH is slow, and check_args() runs
+    for every configuration of the bot.
+    """
+    now = time.monotonic()
+    found = FOUND_IN_CHECK_ARGS.get((kind, name))
+    if found is not None and now - found < FOUND_IN_CHECK_ARGS_TTL:
+        return True
+
+    if not check(name):
+        FOUND_IN_CHECK_ARGS.pop((kind, name), None)
+        return False
+
+    FOUND_IN_CHECK_ARGS[(kind, name)] = now
+    return True
+
+
 def board_power(ykush_port, on=True):
+    global YKUSH_PROCESS
+
     ykushcmd = 'ykushcmd'
     if sys.platform == "win32":
         ykushcmd += '.exe'
 
+    # ykushcmd runs in the background, but the previous command has to be
+    # done (and reaped) before the port is switched again
+    if YKUSH_PROCESS:
+        try:
+            YKUSH_PROCESS.wait(timeout=YKUSH_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logging.error("ykushcmd did not finish in %s s, killing it", YKUSH_TIMEOUT)
+            YKUSH_PROCESS.kill()
+            YKUSH_PROCESS.wait()
+
     if on:
-        subprocess.Popen([ykushcmd, '-u', str(ykush_port)])
+        YKUSH_PROCESS = subprocess.Popen([ykushcmd, '-u', str(ykush_port)])
     else:
-        subprocess.Popen([ykushcmd, '-d', str(ykush_port)])
+        YKUSH_PROCESS = subprocess.Popen([ykushcmd, '-d', str(ykush_port)])
+        # The debugger and its serial port disappear with the board
+        clear_debugger_snr_cache()
+        FOUND_IN_CHECK_ARGS.clear()
@@ -49,6 +49,7 @@ import winutils
 
 import ptscontrol
 from config import SERVER_PORT
+from utils import KeepAliveXMLRPCRequestHandler
 
 log = logging.debug
 PROJECT_DIR = dirname(abspath(__file__))
@@ -292,7 +293,9 @@ class Server(threading.Thread):
 
         print("Serving on port {} ...".format(self._args.srv_port))
 
-        self.server = xmlrpc.server.SimpleXMLRPCServer(("", self._args.srv_port), allow_none=True)
+        self.server = xmlrpc.server.SimpleXMLRPCServer(("", self._args.srv_port),
+                                                       KeepAliveXMLRPCRequestHandler,
+                                                       allow_none=True)
         self.server.register_function(self.request_recovery, 'request_recovery')
         self.server.register_function(self.list_workspace_tree, 'list_workspace_tree')
         self.server.register_function(self.copy_file, 'copy_file')
@@ -301,6 +304,7 @@ class Server(threading.Thread):
         self.server.register_function(self.get_system_model, 'get_system_model')
         self.server.register_instance(self.pts)
         self.server.register_introspection_functions()
+        self.server.register_multicall_functions()
         self.server.timeout = 1.0
 
     def run(self):
@@ -314,10 +318,18 @@ class Server(threading.Thread):
     def request_recovery(self):
         self.is_ready = False
         self.recovery_request = True
+        self.close_connections()
 
     def terminate(self):
         self.is_ready = False
         self.end = True
+        self.close_connections()
+
+    def close_connections(self):
+        # Hand control back to the main loop instead of serving the same
+        # keep-alive connection
+        if self.server:
+            self.server.keep_alive = False
 
     def ready(self):
         return self.is_ready
@@ -90,6 +90,7 @@ class BotConfigArgs(Namespace):
         self.enable_max_logs = args.get('enable_max_logs', False)
         self.retry = args.get('retry', 0)
         self.stress_test = args.get('stress_test', False)
+        self.skip_passed_since = float(args.get('skip_passed_since', 0))
         self.ykush = args.get('ykush', None)
         self.recovery = args.get('recovery', False)
         self.superguard = 60 * float(args.get('superguard', 0))
@@ -122,6 +123,9 @@ class BotClient(Client):
         total_regressions = []
         _args = {}
 
+        # The workspace may have been edited since the previous scheduled run
+        autoptsclient.clear_project_listing_cache()
+
         config_default = self.config_default
         _args[config_default] = self.parse_args(self.parse_config(args))
         autoptsclient.init_logging('_' + '_'.join(str(x) for x in _args[config_default].cli_port))
@@ -205,9 +209,11 @@ def status_dict2summary_html(status_dict):
                   </tr>""".format(total_count)
     summary += "</table>"
 
-    if "PASS" in status_dict:
+    # Test cases skipped for a recent PASS count as passing
+    passed = status_dict.get("PASS", 0) + status_dict.get("SKIPPED_PASSED", 0)
+    if passed:
         pass_rate = \
-            '{0:.2f}%'.format((status_dict["PASS"] / float(total_count) * 100))
+            '{0:.2f}%'.format((passed / float(total_count) * 100))
     else:
         pass_rate = '{0:.2f}%'.format(0)
     summary += "<p><b>PassRate = {}</b></p>".format(pass_rate)
@@ -503,9 +509,11 @@ def make_report_xlsx(results_dict, status_dict, regressions_list,
     worksheet.write(row, col, "Total")
     worksheet.write(row, col + 1, "{}".format(total_count))
     worksheet.write(row + 1, col, "PassRate", bold)
-    if "PASS" in status_dict:
+    # Test cases skipped for a recent PASS count as passing
+    passed = status_dict.get("PASS", 0) + status_dict.get("SKIPPED_PASSED", 0)
+    if passed:
         pass_rate = \
-            '{0:.2f}%'.format((status_dict["PASS"] / float(total_count) * 100))
+            '{0:.2f}%'.format((passed / float(total_count) * 100))
     else:
         pass_rate = '{0:.2f}%'.format(0)
     worksheet.write(row + 1, col + 1, pass_rate, bold)
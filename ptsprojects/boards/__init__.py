@@ -22,12 +22,18 @@ import logging
 import pkgutil
 import importlib
 import subprocess
+import time
 
 # For each new board just create a <new-board-name>.py file that contains reset_cmd() function and list
 # of supported boards.
 
 log = logging.debug
 devices_in_use = []
+# tty -> (jlink serial number, time it was found). Results older than
+# DEBUGGER_SNR_CACHE_TTL seconds are looked up again, e.g. the board on the
+# tty may have been swapped in the meantime.
+DEBUGGER_SNR_CACHE = {}
+DEBUGGER_SNR_CACHE_TTL = 60
 
 
 class Board:
@@ -133,6 +139,13 @@ def get_free_device():
 def get_debugger_snr(tty):
     """Return jlink serial number of the device with the given tty.
     """
+    now = time.monotonic()
+    cached = DEBUGGER_SNR_CACHE.get(tty)
+    if cached is not None and now - cached[1] < DEBUGGER_SNR_CACHE_TTL:
+        return cached[0]
+
+    # Cache under the tty as passed in, it is converted to COM on win32
+    key = tty
     jlink = None
     devices = get_device_list()
     if sys.platform == 'win32':
@@ -143,9 +156,19 @@ def get_debugger_snr(tty):
             jlink = devices[dev]
             break
 
+    # Do not cache a miss, the device may show up later
+    if jlink is not None:
+        DEBUGGER_SNR_CACHE[key] = (jlink, now)
+    else:
+        DEBUGGER_SNR_CACHE.pop(key, None)
+
     return jlink
 
 
+def clear_debugger_snr_cache():
+    DEBUGGER_SNR_CACHE.clear()
+
+
 def release_device(tty):
     if tty and tty in devices_in_use:
         devices_in_use.remove(tty)
@@ -17,6 +17,7 @@ import subprocess
 import logging
 import shlex
 import os
+import time
 import serial
 
 from pybtp import defs
@@ -28,6 +29,10 @@ log = logging.debug
 MYNEWT = None
 IUT_LOG_FO = None
 SERIAL_BAUDRATE = 115200
+# Serial is flushed until it is idle for SERIAL_FLUSH_IDLE seconds, but for
+# no longer than SERIAL_FLUSH_MAX seconds
+SERIAL_FLUSH_IDLE = 0.01
+SERIAL_FLUSH_MAX = 1
 
 
 class MynewtCtl:
@@ -59,7 +64,10 @@ class MynewtCtl:
         log("%s.%s", self.__class__, self.start.__name__)
 
         self.test_case = test_case
-        self.iut_log_file = open(os.path.join(test_case.log_dir, "autopts-iutctl-mynewt.log"), "a")
+        # Only socat writes to the log, through the inherited descriptor, so
+        # no Python side text layer or buffer is needed
+        self.iut_log_file = open(os.path.join(test_case.log_dir, "autopts-iutctl-mynewt.log"), "ab",
+                                 buffering=0)
 
         self.flush_serial()
 
@@ -81,10 +89,13 @@ class MynewtCtl:
 
     def flush_serial(self):
         log("%s.%s", self.__class__, self.flush_serial.__name__)
-        # Try to read data or timeout
+        # Read data until the line goes idle, instead of always waiting for
+        # a long read timeout
         ser = serial.Serial(port=self.tty_file,
-                            baudrate=SERIAL_BAUDRATE, timeout=1)
-        ser.read(99999)
+                            baudrate=SERIAL_BAUDRATE, timeout=SERIAL_FLUSH_IDLE)
+        deadline = time.monotonic() + SERIAL_FLUSH_MAX
+        while ser.read(4096) and time.monotonic() < deadline:
+            pass
         ser.close()
 
     def btmon_start(self):
@@ -113,6 +124,10 @@ class MynewtCtl:
         """Restart IUT related processes and reset the IUT"""
         log("%s.%s", self.__class__, self.reset.__name__)
 
+        # socat and the BTP socket are not reused across the reset: bytes
+        # already queued in them, e.g. a frame cut by the board reset, would
+        # stay in the stream. A fresh BTP socket, opened after start() has
+        # flushed the tty, reads the IUT ready event frame aligned.
         self.stop()
         self.start(self.test_case)
         self.flush_serial()
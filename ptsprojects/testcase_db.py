@@ -1,4 +1,5 @@
 import sqlite3
+import time
 
 DATABASE_FILE = 'TestCase.db'
 
@@ -11,7 +12,14 @@ class TestCaseTable:
 
         self.cursor.execute(
             "CREATE TABLE IF NOT EXISTS {} (name TEXT, duration REAL, "
-            "count INTEGER, result TEXT);".format(self.name))
+            "count INTEGER, result TEXT, timestamp REAL);".format(self.name))
+
+        # Tables created by older versions lack the timestamp column
+        self.cursor.execute("PRAGMA table_info({});".format(self.name))
+        if 'timestamp' not in [column[1] for column in self.cursor.fetchall()]:
+            self.cursor.execute(
+                "ALTER TABLE {} ADD COLUMN timestamp REAL;".format(self.name))
+
         self.conn.commit()
 
         self._close()
@@ -25,17 +33,31 @@ class TestCaseTable:
         self.conn.close()
 
     def update_statistics(self, test_case_name, duration, result):
+        self.update_statistics_batch([(test_case_name, duration, result)])
+
+    def update_statistics_batch(self, statistics):
+        """Update statistics of many test cases in a single transaction
+
+        statistics -- iterable of (test_case_name, duration, result)
+
+        """
         self._open()
 
+        for test_case_name, duration, result in statistics:
+            self._update_statistics(test_case_name, duration, result)
+
+        self.conn.commit()
+        self._close()
+
+    def _update_statistics(self, test_case_name, duration, result):
         self.cursor.execute(
             "SELECT duration, count FROM {} "
             "WHERE name=:name;".format(self.name), {"name": test_case_name})
         row = self.cursor.fetchall()
         if len(row) == 0:
             self.cursor.execute(
-                "INSERT INTO {} VALUES(?, ?, ?, ?);".format(self.name),
-                (test_case_name, duration, 1, result))
-            self.conn.commit()
+                "INSERT INTO {} VALUES(?, ?, ?, ?, ?);".format(self.name),
+                (test_case_name, duration, 1, result, time.time()))
             return
 
         (mean, count) = row[0]
@@ -47,13 +69,13 @@ class TestCaseTable:
         mean += (duration - mean) // count
 
         self.cursor.execute(
-            "UPDATE {} SET duration=:duration, count=:count, result=:result "
+            "UPDATE {} SET duration=:duration, count=:count, result=:result, "
+            "timestamp=:timestamp "
             "WHERE name=:name".format(self.name), {"duration": mean,
                                                    "count": count,
                                                    "name": test_case_name,
-                                                   "result": result})
-        self.conn.commit()
-        self._close()
+                                                   "result": result,
+                                                   "timestamp": time.time()})
 
     def get_mean_duration(self, test_case_name):
         self._open()
@@ -81,6 +103,21 @@ class TestCaseTable:
         self._close()
         return None
 
+    def get_last_results(self):
+        """Returns dict of test case name: (result, timestamp) of all test
+        cases, read in a single query
+
+        """
+        self._open()
+
+        self.cursor.execute(
+            "SELECT name, result, timestamp FROM {}".format(self.name))
+        last_results = {name: (result, timestamp)
+                        for name, result, timestamp in self.cursor.fetchall()}
+
+        self._close()
+        return last_results
+
     def estimate_session_duration(self, test_cases_names, run_count_max):
         duration = 0
         count_unknown = 0
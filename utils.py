@@ -17,7 +17,9 @@
 """Utilities"""
 
 import ctypes
+import logging
 import threading
+from xmlrpc.server import SimpleXMLRPCRequestHandler
 
 
 class InterruptableThread(threading.Thread):
@@ -55,3 +57,47 @@ class InterruptableThread(threading.Thread):
         if res > 1:
             ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, 0)
             print('Exception raise failure')
+
+
+class KeepAliveXMLRPCRequestHandler(SimpleXMLRPCRequestHandler):
+    """XML-RPC request handler keeping HTTP/1.1 connections alive
+
+    xmlrpc.client.Transport reuses its connection as long as the server does
+    not close it, which saves a TCP handshake per call. The servers handle
+    one connection at a time, so any other client waits until the kept
+    alive connection has been idle for timeout seconds. The timeout is kept
+    short, it only needs to cover back-to-back calls; the client
+    transparently reconnects on a later call. I/O of a request in progress
+    is not time limited.
+
+    Setting keep_alive of the server to False closes the connection after the
+    current request, which returns control to a handle_request() loop.
+
+    """
+    protocol_version = "HTTP/1.1"
+    timeout = 0.1
+
+    def handle_one_request(self):
+        # timeout only limits the wait for the next request
+        self.connection.settimeout(self.timeout)
+        super().handle_one_request()
+
+    def parse_request(self):
+        # The request line has arrived, reading the rest of the request and
+        # sending the response may take as long as it needs
+        self.connection.settimeout(None)
+        return super().parse_request()
+
+    def do_POST(self):
+        super().do_POST()
+
+        if not getattr(self.server, 'keep_alive', True):
+            self.close_connection = True
+
+    def log_error(self, format, *args):
+        # Idle timeouts are expected, do not print them to stderr
+        if format.startswith("Request timed out"):
+            logging.debug("%s - %s", self.address_string(), format % args)
+            return
+
+        super().log_error(format, *args)
@@ -35,12 +35,25 @@ import sys
 import ctypes
 
 
+# Result of have_admin_rights(), it does not change during the process life
+ADMIN_RIGHTS = None
+
+
 class AdminStateUnknownError(Exception):
     pass
 
 
 def have_admin_rights():
     """"Check if the process has Administrator rights"""
+    global ADMIN_RIGHTS
+
+    if ADMIN_RIGHTS is None:
+        ADMIN_RIGHTS = _have_admin_rights()
+
+    return ADMIN_RIGHTS
+
+
+def _have_admin_rights():
     try:
         return os.getuid() == 0
     except AttributeError: